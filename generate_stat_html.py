@@ -4,7 +4,7 @@ from html import escape
 from collections import defaultdict
 from datetime import timedelta
 from difflib import SequenceMatcher
-from typing import IO, List, Sequence
+from typing import IO, List, Optional, Sequence
 
 try:
     import plotly.offline as py
@@ -163,7 +163,7 @@ class HTMLPrinter:
         self.finish()
 
     def extend_with_project(self, name: str, data: dict,
-                            extra_charts: dict) -> None:
+                            extra_charts: Optional[dict] = None) -> None:
         first = len(self.projects) == 0
         self.projects[name] = data
         stat_html = open(self.html_path, 'a')
@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
 import argparse as ap
+import copy
+import fcntl
+import hashlib
+import io
 import json
 import logging
 import multiprocessing
@@ -11,19 +15,38 @@ import subprocess as sp
 import sys
 import tarfile
 import tempfile
+import threading
 import zipfile
 from collections import Counter
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor, \
+    ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import timedelta
 from distutils.dir_util import copy_tree
-from io import TextIOWrapper
 from pathlib import Path
-from typing import Mapping, Optional, Sequence, Tuple, Union
+from typing import ContextManager, Iterator, Mapping, Optional, Sequence, \
+    Tuple, Union
 from urllib.request import urlretrieve
 
 from generate_stat_html import HTMLPrinter
 from summarize_gcov import summarize_gcov
 from summarize_sa_stats import summ_stats
 
+try:
+    from gcovr.__main__ import main as gcovr_main
+    GCOVR_SUPPORTED = True
+except ImportError:
+    GCOVR_SUPPORTED = False
+
+
+# Output of 'clang --version' keyed by the 'clang_path' of a configuration.
+_CLANG_VERSION_CACHE = {}
+_CLANG_VERSION_LOCK = threading.Lock()
+
+# Bare repositories holding the checked out revisions, reused between runs.
+MIRROR_CACHE_DIR = os.path.expanduser("~/.cache/csa-testbench/mirrors")
+
 
 def make_dir(path: str) -> None:
     Path(path).mkdir(parents=True, exist_ok=True)
@@ -39,18 +62,47 @@ def load_config(config_path: str) -> dict:
     return config_dict
 
 
+# The supported line counters in the order of preference. The first two are
+# much faster than cloc on large projects.
+LOC_TOOLS = ("tokei", "scc", "cloc")
+
+# The reason of a failure is at the end of the error output.
+STDERR_TAIL = 64 * 1024
+
+# Projects with these URLs are downloaded and extracted instead of cloned.
+# TODO: support zip files.
+TARBALL_EXTENSIONS = (".tar.gz", ".tar.xz", ".tar.lz", ".tgz", ".tbz",
+                      ".tlz", ".txz")
+
+
 def run_command(cmd: Union[str, Sequence[str]], print_error: bool = True,
                 cwd: Optional[str] = None,
                 env: Optional[Mapping[str, str]] = None,
-                shell: bool = False) -> Tuple[int, str, str]:
-    args = shlex.split(cmd) if not shell else cmd
+                shell: bool = False,
+                capture_stdout: bool = False) -> Tuple[int, str, str]:
+    """Runs a command given as an argument list.
+
+    Only user provided commands are passed as a string, those are
+    executed by the shell.
+
+    The standard output is discarded unless capture_stdout is set, as the
+    build and analysis commands can print hundreds of megabytes. For the
+    same reason, the error output is spooled to a temporary file and only
+    its last STDERR_TAIL bytes are returned.
+    """
     try:
-        proc = sp.Popen(args, stdin=sp.PIPE, stdout=sp.PIPE,
-                        stderr=sp.PIPE, cwd=cwd, env=env, shell=shell,
-                        encoding="utf-8", universal_newlines=True,
-                        errors="ignore")
-        stdout, stderr = proc.communicate()
-        retcode = proc.returncode
+        with tempfile.TemporaryFile() as stderr_file:
+            proc = sp.Popen(cmd, stdin=sp.PIPE,
+                            stdout=sp.PIPE if capture_stdout else sp.DEVNULL,
+                            stderr=stderr_file, cwd=cwd, env=env,
+                            shell=shell, encoding="utf-8",
+                            universal_newlines=True, errors="ignore")
+            stdout, _ = proc.communicate()
+            stdout = stdout or ""
+            retcode = proc.returncode
+            stderr_size = stderr_file.seek(0, os.SEEK_END)
+            stderr_file.seek(max(0, stderr_size - STDERR_TAIL))
+            stderr = stderr_file.read().decode("utf-8", "ignore")
     except FileNotFoundError:
         retcode = 2
         stdout, stderr = "", ""
@@ -60,41 +112,341 @@ def run_command(cmd: Union[str, Sequence[str]], print_error: bool = True,
     return retcode, stdout, stderr
 
 
-def count_lines(project: dict, project_dir: str) -> None:
-    failed, stdout, _ = run_command(
-        'cloc "%s" --json --not-match-d="cc_results"' % project_dir, False)
-    if not failed:
+def source_revision(project: dict, project_dir: str) -> Optional[str]:
+    """
+    Identifies the checked out sources of a project, or returns None if
+    they cannot be identified reliably.
+    """
+    if project.get('prepared', False) or project.get('subprojects'):
+        return None
+    # Tarballs are identified by their URL. They are checked first, as the
+    # output directory might be inside another git repository.
+    if project.get('url', '').endswith(TARBALL_EXTENSIONS):
+        return project['url']
+    failed, out, _ = run_command(
+        ["git", "-C", project_dir, "rev-parse", "--show-toplevel", "HEAD"],
+        False, capture_stdout=True)
+    if failed:
+        return None
+    toplevel, head = out.splitlines()
+    # The HEAD of an enclosing repository does not identify the project.
+    if os.path.realpath(toplevel) != os.path.realpath(project_dir):
+        return None
+    return head
+
+
+def load_loc_report(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8", errors="ignore") as report:
+            return json.load(report)
+    except (OSError, ValueError):
+        return None
+
+
+def write_loc_report(path: str, loc_report: dict) -> None:
+    """
+    Replaces the report atomically, so an interrupted run cannot leave a
+    truncated report behind.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as report:
+        json.dump(loc_report, report)
+    os.replace(tmp_path, path)
+
+
+def run_loc_counter(project_dir: str, tool: str) -> Optional[dict]:
+    """
+    Counts the lines of code with one of LOC_TOOLS. Returns the report in
+    the format of cloc.
+    """
+    if tool == "cloc":
+        handle, report_path = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
         try:
-            cloc_json_out = json.loads(stdout)
-            project["LOC"] = cloc_json_out["SUM"]["code"]
-        except:
-            pass
+            failed, _, _ = run_command(
+                ["cloc", project_dir, "--json", "--not-match-d=cc_results",
+                 "--report-file=" + report_path], False)
+            return None if failed else load_loc_report(report_path)
+        finally:
+            os.remove(report_path)
+
+    if tool == "tokei":
+        cmd = ["tokei", "--output", "json", "--exclude", "cc_results*",
+               project_dir]
+    elif tool == "scc":
+        cmd = ["scc", "--format", "json", "--not-match", "cc_results",
+               project_dir]
+    else:
+        raise ValueError("Unknown line counter '%s'." % tool)
+    failed, stdout, _ = run_command(cmd, False, capture_stdout=True)
+    if failed:
+        return None
+    try:
+        report = json.loads(stdout)
+        if tool == "tokei":
+            code = report["Total"]["code"]
+        else:
+            # scc reports the languages separately.
+            code = sum(language["Code"] for language in report)
+    except (ValueError, KeyError, TypeError):
+        return None
+    return {"SUM": {"code": code}}
+
+
+def find_loc_tool() -> Optional[str]:
+    """Returns the first of LOC_TOOLS that is in the path."""
+    for tool in LOC_TOOLS:
+        if shutil.which(tool):
+            return tool
+    return None
+
+
+def count_lines(project: dict, project_dir: str) -> None:
+    """Counts the lines of code of a project with its 'loc_tool', unless
+    disabled by 'count_loc'.
+
+    The report is kept next to the project directory, and reused as long
+    as the same revision is checked out and counted by the same tool.
+    """
+    # Prepared projects are not counted by default, as they are not
+    # checked out by the script.
+    if not project.get('count_loc', not project.get('prepared', False)) or \
+            not project.get('loc_tool'):
+        return
+    report_path = project_dir.rstrip(os.sep) + ".loc.json"
+    revision = source_revision(project, project_dir)
+    loc_report = load_loc_report(report_path) if revision else None
+    if loc_report and (loc_report.get("revision") != revision or
+                       loc_report.get("loc_tool") != project['loc_tool']):
+        loc_report = None
+
+    if loc_report is None:
+        loc_report = run_loc_counter(project_dir, project['loc_tool'])
+        if loc_report and revision:
+            loc_report["revision"] = revision
+            loc_report["loc_tool"] = project['loc_tool']
+            write_loc_report(report_path, loc_report)
+    try:
+        project["LOC"] = loc_report["SUM"]["code"]
+    except (KeyError, TypeError):
+        pass
     logging.info("[%s] LOC: %s.", project['name'], project.get('LOC', '?'))
 
 
+@contextmanager
+def mirror_lock(mirror_dir: str) -> Iterator[None]:
+    """
+    Serializes the use of a mirror between the worker threads and also
+    between concurrently running instances of the script.
+    """
+    make_dir(MIRROR_CACHE_DIR)
+    with open(mirror_dir + ".lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def mirror_path(url: str) -> str:
+    return os.path.join(MIRROR_CACHE_DIR,
+                        hashlib.sha1(url.encode("utf-8")).hexdigest() + ".git")
+
+
+def update_mirror(project: dict, mirror_dir: str) -> Optional[str]:
+    """Fetches the requested revision of a project into its cached mirror.
+
+    The mirror is a bare repository holding only the revisions checked out
+    so far. They are fetched shallowly, as by clone_from_remote, so the
+    history and the other refs of the remote are never downloaded.
+    Returns the fetched commit, or None on failure.
+    """
+    git = ["git", "-C", mirror_dir]
+    if not os.path.isdir(mirror_dir):
+        failed, _, _ = run_command(["git", "init", "-q", "--bare",
+                                    mirror_dir], print_error=False)
+        if not failed:
+            failed, _, _ = run_command(git + ["remote", "add", "origin",
+                                              project['url']],
+                                       print_error=False)
+        if failed:
+            shutil.rmtree(mirror_dir, ignore_errors=True)
+            return None
+
+    fetch = git + ["fetch", "-q", "--depth", "1", "origin"]
+    failed, _, err = run_command(fetch + [project['tag']], print_error=False)
+    # If no tag was specified, use the default branch of the remote.
+    if failed and 'master' in str(err):
+        failed, _, err = run_command(fetch + ["HEAD"], print_error=False)
+    revision = "FETCH_HEAD"
+    if failed:
+        # Abbreviated commit hashes cannot be fetched directly.
+        failed, _, _ = run_command(git + ["fetch", "-q", "--filter=blob:none",
+                                          "--tags", "origin"],
+                                   print_error=False)
+        revision = project['tag']
+    if failed:
+        return None
+    failed, commit, _ = run_command(
+        git + ["rev-parse", "--verify", revision + "^{commit}"], False,
+        capture_stdout=True)
+    return None if failed else commit.strip()
+
+
+def clean_checkout(project_dir: str, source_dir: str) -> bool:
+    """
+    Removes everything that is not part of the checked out revision, except
+    the analysis results in the source_dir.
+    """
+    results = os.path.relpath(source_dir, project_dir)
+    results = "/cc_results*" if results == os.curdir else \
+        "/" + results + "/cc_results*"
+    failed, _, _ = run_command(["git", "-C", project_dir, "clean", "-q", "-d",
+                                "-f", "-x", "-e", results])
+    return not failed
+
+
+def update_worktree(project_dir: str, source_dir: str, mirror_dir: str,
+                    commit: str) -> bool:
+    """Updates an earlier worktree of the same mirror in place.
+
+    The previous analysis results are kept, so they can be reused if
+    nothing has changed.
+    """
+    if not os.path.isfile(os.path.join(project_dir, ".git")):
+        return False
+    git = ["git", "-C", project_dir]
+    failed, common_dir, _ = run_command(
+        git + ["rev-parse", "--git-common-dir"], False, capture_stdout=True)
+    common_dir = os.path.join(project_dir, common_dir.strip())
+    if failed or os.path.realpath(common_dir) != os.path.realpath(mirror_dir):
+        return False
+    # Local changes of the tracked files are discarded as well.
+    failed, _, _ = run_command(git + ["checkout", "-q", "-f", "--detach",
+                                      commit], print_error=False)
+    return not failed and clean_checkout(project_dir, source_dir)
+
+
+def checkout_from_mirror(project: dict, project_dir: str,
+                         source_dir: str) -> bool:
+    """Checks out a project as a worktree of its cached mirror.
+
+    Only the requested revision is fetched from the remote. An earlier
+    worktree of the mirror is updated in place.
+    """
+    mirror_dir = mirror_path(project['url'])
+    with mirror_lock(mirror_dir):
+        commit = update_mirror(project, mirror_dir)
+        if not commit:
+            logging.warning("[%s] Cannot update the mirror, "
+                            "falling back to clone.", project['name'])
+            return False
+        if update_worktree(project_dir, source_dir, mirror_dir, commit):
+            return True
+        if os.path.isdir(project_dir):
+            shutil.rmtree(project_dir)
+        # Forget about the worktrees that were removed since the last run.
+        run_command(["git", "-C", mirror_dir, "worktree", "prune"])
+        failed, _, err = run_command(["git", "-C", mirror_dir, "worktree",
+                                      "add", "--detach", project_dir, commit],
+                                     print_error=False)
+    if failed:
+        logging.warning("[%s] Checkout from mirror failed, "
+                        "falling back to clone.\n%s", project['name'], err)
+        shutil.rmtree(project_dir, ignore_errors=True)
+        return False
+    return True
+
+
+def clone_from_remote(project: dict, project_dir: str) -> bool:
+    """Fetches only the requested revision of a project.
+
+    Both tags and commit hashes are fetched shallowly, so the history of
+    the project is never downloaded. Abbreviated commit hashes cannot be
+    fetched directly, those fall back to a blobless clone of the whole
+    repository, where only the contents of the checked out revision are
+    downloaded.
+    """
+    git = ["git", "-C", project_dir]
+    sys.stdout.flush()
+    init_failed, _, _ = run_command(["git", "init", "-q", project_dir])
+    if init_failed:
+        return False
+    remote_failed, _, _ = run_command(git + ["remote", "add", "origin",
+                                             project['url']])
+    if remote_failed:
+        return False
+
+    fetch = git + ["fetch", "-q", "--depth", "1", "origin"]
+    fetch_failed, _, fetch_err = run_command(fetch + [project['tag']],
+                                             print_error=False)
+    # If no tag was specified, use the default branch of the remote.
+    if fetch_failed and 'master' in str(fetch_err):
+        fetch_failed, _, fetch_err = run_command(fetch + ["HEAD"],
+                                                 print_error=False)
+    if not fetch_failed:
+        checkout_failed, _, _ = run_command(
+            git + ["checkout", "-q", "FETCH_HEAD"])
+        return not checkout_failed
+
+    fetch_failed, _, _ = run_command(git + ["fetch", "-q",
+                                            "--filter=blob:none", "--tags",
+                                            "origin"])
+    if fetch_failed:
+        return False
+    checkout_failed, _, _ = run_command(git + ["checkout", "-q",
+                                               project['tag']])
+    return not checkout_failed
+
+
+def update_clone(project: dict, project_dir: str, source_dir: str) -> bool:
+    """Updates an earlier clone of the same remote in place.
+
+    Only the requested revision is fetched, and the previous analysis
+    results are kept, so they can be reused if nothing has changed.
+    Worktrees of the mirrors are updated by update_worktree.
+    """
+    if not os.path.isdir(os.path.join(project_dir, ".git")):
+        return False
+    git = ["git", "-C", project_dir]
+    failed, url, _ = run_command(git + ["remote", "get-url", "origin"],
+                                 False, capture_stdout=True)
+    if failed or url.strip() != project['url']:
+        return False
+    fetch = git + ["fetch", "-q", "--depth", "1", "origin"]
+    failed, _, err = run_command(fetch + [project['tag']], print_error=False)
+    if failed and 'master' in str(err):
+        failed, _, err = run_command(fetch + ["HEAD"], print_error=False)
+    if failed:
+        return False
+    failed, _, _ = run_command(git + ["reset", "-q", "--hard", "FETCH_HEAD"])
+    return not failed and clean_checkout(project_dir, source_dir)
+
+
 def clone_project(project: dict, project_dir: str, source_dir: str,
-                  is_subproject: bool = False) -> bool:
+                  is_subproject: bool = False,
+                  use_cache: bool = True) -> bool:
     """Clone a single project.
 
     Its version is specified by a version tag or a commit hash
     found in the config file.
 
-    If a project already exists, we simply overwrite it.
+    Git repositories are mirrored under MIRROR_CACHE_DIR, so subsequent
+    runs only need to fetch the new commits. Set use_cache to False to
+    clone directly from the remote.
+
+    If a project already exists, it is updated in place if it is a
+    worktree of the same mirror or a clone of the same remote, otherwise
+    we simply overwrite it.
     """
     if project.get('prepared', False):
         count_lines(project, project_dir)
         return True
 
-    if os.path.isdir(project_dir):
-        shutil.rmtree(project_dir)
-
     project_str = "subproject" if is_subproject else "project"
     logging.info("[%s] Checking out %s... ", project['name'], project_str)
 
     # Check if tarball is provided.
-    # TODO: support zip files.
-    if project['url'].endswith((".tar.gz", ".tar.xz", ".tar.lz", ".tgz",
-                                ".tbz", ".tlz", ".txz")):
+    if project['url'].endswith(TARBALL_EXTENSIONS):
+        if os.path.isdir(project_dir):
+            shutil.rmtree(project_dir)
         path, _ = urlretrieve(project['url'])
         with tarfile.open(path) as tar:
             def is_within_directory(directory, target):
@@ -131,44 +483,29 @@ def clone_project(project: dict, project_dir: str, source_dir: str,
     # This presumes that a master branch exists.
     project['tag'] = project.get('tag', 'master')
 
-    try:
-        int(project['tag'], base=16)
-        commit_hash = True
-    except ValueError:
-        commit_hash = False
-
-    # If the 'tag' value is a version tag, we can use shallow cloning.
-    # With a commit hash, we need to clone everything and then checkout
-    # the specified commit.
-    cmd = {'clone': 'git clone %s "%s"' % (project['url'], project_dir)}
-
-    if commit_hash:
-        cmd['checkout'] = 'git -C "%s" checkout %s' % (
-            project_dir, project['tag'])
-    else:
-        cmd['clone'] += ' --depth 1 --branch %s --single-branch' % \
-                        project['tag']
-
-    sys.stdout.flush()
-    clone_failed, _, clone_err = run_command(cmd['clone'], print_error=False)
-    if clone_failed and 'master' in str(clone_err):
-        clone_failed, _, _ = run_command(
-            'git clone %s "%s"' % (project['url'], project_dir))
-    if clone_failed:
-        return False
-    if 'checkout' in cmd:
-        checkout_failed, _, _ = run_command(cmd['checkout'])
-        if checkout_failed:
+    checked_out = update_clone(project, project_dir, source_dir) or \
+        use_cache and checkout_from_mirror(project, project_dir, source_dir)
+    if not checked_out:
+        if os.path.isdir(project_dir):
+            shutil.rmtree(project_dir)
+        if not clone_from_remote(project, project_dir):
             return False
 
     for sub_project in project.get("subprojects", []):
         sub_dir = os.path.join(source_dir, sub_project["subdir"])
-        if not clone_project(sub_project, sub_dir, sub_dir, True):
+        if not clone_project(sub_project, sub_dir, sub_dir, True, use_cache):
             return False
 
     if project.get('submodules', False):
-        submodule_failed, _, _ = run_command('git submodule update --init',
-                                             cwd=project_dir)
+        cmd = ["git", "submodule", "update", "--init", "--recursive"]
+        submodule_failed = True
+        # Some servers refuse shallow fetches, retry with full history.
+        if project.get('shallow_submodules', True):
+            submodule_failed, _, _ = run_command(
+                cmd + ["--depth", "1", "--recommend-shallow"],
+                print_error=False, cwd=project_dir)
+        if submodule_failed:
+            submodule_failed, _, _ = run_command(cmd, cwd=project_dir)
         if submodule_failed:
             return False
 
@@ -191,7 +528,8 @@ def identify_build_system(project_dir: str, configure: bool) -> Optional[str]:
            heuristics for src subfolder if exists?
     """
 
-    project_files = os.listdir(project_dir)
+    with os.scandir(project_dir) as entries:
+        project_files = {entry.name for entry in entries}
     if not project_files:
         logging.error("No files found in '%s'.\n", project_dir)
         return None
@@ -209,15 +547,19 @@ def identify_build_system(project_dir: str, configure: bool) -> Optional[str]:
 
     if 'autogen.sh' in project_files:
         # Autogen needs to be executed in the project's root directory.
-        autogen_failed, _, _ = run_command("sh autogen.sh", cwd=project_dir)
+        autogen_failed, _, _ = run_command(["sh", "autogen.sh"],
+                                         cwd=project_dir)
         if autogen_failed:
             return None
 
-    # Need to re-list files, as autogen might have generated a config script.
-    project_files = os.listdir(project_dir)
+        # Need to re-list files, as autogen might have generated a config
+        # script.
+        with os.scandir(project_dir) as entries:
+            project_files = {entry.name for entry in entries}
 
     if 'configure' in project_files:
-        configure_failed, _, _ = run_command("./configure", cwd=project_dir)
+        configure_failed, _, _ = run_command(["./configure"],
+                                            cwd=project_dir)
         if configure_failed:
             return None
         return 'makefile'
@@ -226,21 +568,6 @@ def identify_build_system(project_dir: str, configure: bool) -> Optional[str]:
     return None
 
 
-def check_logged(projects_root: str, projects: Sequence[dict]) -> int:
-    """ Count successfully checked projects."""
-
-    configured_projects = {project["name"] for project in projects}
-    project_dirs = os.listdir(projects_root)
-    num = 0
-    for project in project_dirs:
-        if os.path.isfile(os.path.join(projects_root, project)):
-            continue
-        if project not in configured_projects:
-            continue
-        num += 1
-    return num
-
-
 def get_compilation_database(project: dict,
                              project_dir: str)  -> Tuple[str, str]:
     binary_dir = project_dir
@@ -270,12 +597,12 @@ def log_project(project: dict, project_dir: str, num_jobs: int) -> bool:
     logging.info("[%s] Generating build log... ", project['name'])
     json_path, binary_dir = get_compilation_database(project, project_dir)
     if build_sys == 'cmake':
-        cmd = 'cmake -DCMAKE_EXPORT_COMPILE_COMMANDS=ON -B"%s" -H"%s"' \
-              % (binary_dir, project_dir)
+        cmd = ["cmake", "-DCMAKE_EXPORT_COMPILE_COMMANDS=ON",
+               "-B" + binary_dir, "-H" + project_dir]
         failed, _, _ = run_command(cmd, True, binary_dir)
     elif build_sys == 'makefile':
-        cmd = "CodeChecker log -b 'make -j%d' -o \"%s\"" \
-              % (num_jobs, json_path)
+        cmd = ["CodeChecker", "log", "-b", "make -j%d" % num_jobs,
+               "-o", json_path]
         failed, _, _ = run_command(cmd, True, project_dir)
     elif build_sys == 'userprovided':
         if not project['make_command']:
@@ -283,9 +610,9 @@ def log_project(project: dict, project_dir: str, num_jobs: int) -> bool:
         else:
             project['make_command'] = \
                 project['make_command'].replace("$JOBS", str(num_jobs))
-            cmd = "CodeChecker log -b '%s' -o \"%s\"" \
-                  % (project['make_command'], json_path)
-            failed, _, _ = run_command(cmd, True, project_dir, shell=True)
+            cmd = ["CodeChecker", "log", "-b", project['make_command'],
+                   "-o", json_path]
+            failed, _, _ = run_command(cmd, True, project_dir)
     if failed:
         shutil.rmtree(project_dir)
         return False
@@ -293,146 +620,286 @@ def log_project(project: dict, project_dir: str, num_jobs: int) -> bool:
     return True
 
 
+ARG_NAMES = ("clang_sa_args", "clang_tidy_args", "analyze_args",
+             "store_args")
+
+
 def collect_args(arg_name: str, configuration_sources: Sequence[dict]) -> str:
-    return " ".join([conf.get(arg_name, "")
-                     for conf in configuration_sources])
+    return " ".join(conf[arg_name] for conf in configuration_sources
+                    if conf.get(arg_name))
 
 
-def make_args_file(args: str) -> Tuple[int, str]:
+def make_args_file(args: str) -> Optional[str]:
     """
     Creates a temporary file containing the argument string ``args``, if
-    and only if non-empty.
+    and only if non-empty. The caller is responsible for removing it.
     """
     if not args:
-        return 0, ""
+        return None
 
     file, filename = tempfile.mkstemp(text=True)
-    with open(file, 'w') as handle:
-        handle.write(args)
-    return file, str(filename)
+    try:
+        os.write(file, args.encode("utf-8"))
+    finally:
+        os.close(file)
+    return filename
 
 
 def update_path(path: str, env: Optional[Mapping[str, str]] = None) \
     -> Mapping[str, str]:
-    if env is None:
-        env = os.environ
+    # Work on a copy so the PATH of one configuration does not leak into
+    # the environment of the others.
+    env = dict(os.environ if env is None else env)
     env["PATH"] = path + ":" + env["PATH"]
     return env
 
 
+def get_clang_version(clang_path: str,
+                      env: Optional[Mapping[str, str]] = None) -> str:
+    """Returns the output of 'clang --version' for the given clang_path.
+
+    Configurations usually share the same toolchain, so the result is
+    cached to avoid running the same command again and again.
+    """
+    with _CLANG_VERSION_LOCK:
+        version = _CLANG_VERSION_CACHE.get(clang_path)
+        if version is None:
+            _, version, _ = run_command(["clang", "--version"], env=env,
+                                        capture_stdout=True)
+            _CLANG_VERSION_CACHE[clang_path] = version
+    return version
+
+
 def build_package(project: dict, project_dir: str, jobs: int) -> bool:
     logging.info("[%s] Generating build log... ", project['name'])
     make_dir(project_dir)
     json_path, _ = get_compilation_database(project, project_dir)
     if project["package_type"] == "vcpkg":
-        run_command("vcpkg remove %s" % project["package"], True, project_dir)
-        cmd = "CodeChecker log -b 'vcpkg install %s' -o \"%s\"" \
-            % (project["package"], json_path)
+        run_command(["vcpkg", "remove", project["package"]], True,
+                    project_dir)
+        cmd = ["CodeChecker", "log", "-b",
+               "vcpkg install %s" % project["package"], "-o", json_path]
         failed, _, _ = run_command(cmd, True, project_dir)
         return not failed
     if project["package_type"] == "conan":
-        run_command("conan install %s" % project["package"], True, project_dir)
-        cmd = "CodeChecker log -b 'conan install %s --build' -o \"%s\"" \
-            % (project["package"], json_path)
+        run_command(["conan", "install", project["package"]], True,
+                    project_dir)
+        cmd = ["CodeChecker", "log", "-b",
+               "conan install %s --build" % project["package"],
+               "-o", json_path]
         failed, _, _ = run_command(cmd, True, project_dir)
         return not failed
     logging.info("[%s] Unsupported package.", project['name'])
     return False
 
 
+def analysis_digest(json_path: str, revision: Optional[str],
+                    settings: Sequence[str]) -> Optional[str]:
+    """
+    Computes a digest of everything that determines the analysis results:
+    the compilation database, the checked out revision and the settings.
+    Returns None if the sources cannot be identified by a revision, as
+    those results must not be reused.
+    """
+    if not revision:
+        return None
+    digest = hashlib.sha256()
+    try:
+        with open(json_path, 'rb') as compile_commands:
+            digest.update(compile_commands.read())
+    except OSError:
+        return None
+    for part in [revision] + list(settings):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def read_digest(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding="utf-8", errors="ignore") as digest_file:
+            return digest_file.read()
+    except OSError:
+        return None
+
+
+def has_reports(result_path: str) -> bool:
+    try:
+        with os.scandir(result_path) as entries:
+            return any(entry.name.endswith(".plist") for entry in entries)
+    except OSError:
+        return False
+
+
+def store_results(cmd: Sequence[str], env: Optional[Mapping[str, str]],
+                  name: str) -> None:
+    run_command(cmd, print_error=True, env=env)
+    logging.info("[%s] Results stored.", name)
+
+
 def check_project(project: dict, project_dir: str, config: dict,
-                  num_jobs: int) -> None:
-    """Analyze project and store the results with CodeChecker."""
+                  num_jobs: int, revision: Optional[str] = None) -> None:
+    """Analyze project and store the results with CodeChecker.
+
+    The results of an earlier run are reused if the sources, identified by
+    revision, and the configuration are the same.
+    """
 
     json_path, _ = get_compilation_database(project, project_dir)
+    # The paths and names of the runs are recorded in the configurations,
+    # so the projects processed in parallel must not share them.
     if "configurations" not in project:
-        project["configurations"] = config.get("configurations",
-                                               [{"name": ""}])
+        project["configurations"] = copy.deepcopy(
+            config.get("configurations", [{"name": ""}]))
     _, skippath = tempfile.mkstemp()
     with open(skippath, 'w', encoding="utf-8", errors="ignore") \
             as skipfile:
         skipfile.write("\n".join(project.get("skip", [])))
-    for run_config in project["configurations"]:
-        result_dir = "cc_results"
-        if run_config["name"]:
-            result_dir += "_" + run_config["name"]
-        result_path = os.path.join(project_dir, result_dir)
-        run_config["result_path"] = result_path
-
-        conf_sources = [config["CodeChecker"], project, run_config]
-        sa_args = collect_args("clang_sa_args", conf_sources)
-        if run_config.get("coverage", False):
-            coverage_dir = os.path.join(result_path, "coverage")
-            run_config["coverage_dir"] = coverage_dir
-            sa_args += (" -Xclang -analyzer-config "
-                        "-Xclang record-coverage=%s " % coverage_dir)
-        sa_args_file, sa_args_filename = make_args_file(sa_args)
-
-        tidy_args_file, tidy_args_filename = make_args_file(
-            collect_args("clang_tidy_args", conf_sources))
-
-        tag = project.get("tag")
-        name = project["name"]
-        if tag:
-            name += "_" + tag
-        if run_config["name"]:
-            name += "_" + run_config["name"]
-        run_config["full_name"] = name
-
-        logging.info("[%s] Analyzing project... ", name)
-        env = None
-        if "clang_path" in run_config:
-            env = update_path(run_config["clang_path"])
-        _, version_string, _ = run_command("clang --version", env=env)
-        run_config["analyzer_version"] = version_string
-        analyzers = config["CodeChecker"].get("analyzers", "clangsa")
-        cmd = ("CodeChecker analyze '%s' -j%d -o '%s' -q " +
-               "--analyzers %s --capture-analysis-output") \
-            % (json_path, num_jobs, result_path, analyzers)
-        if sa_args_file:
-            cmd += " --saargs %s " % sa_args_filename
-        if tidy_args_file:
-            cmd += " --tidyargs %s " % tidy_args_filename
-        cmd += " --skip %s " % skippath
-        cmd += collect_args("analyze_args", conf_sources)
-        run_command(cmd, print_error=True, env=env)
-
-        logging.info("[%s] Done. Storing results...", name)
-        cmd = "CodeChecker store '%s' --url '%s' -n %s " \
-              % (result_path, config["CodeChecker"]["url"], name)
-        if tag:
-            cmd += " --tag %s " % tag
-        cmd += collect_args("store_args", conf_sources)
-        run_command(cmd, print_error=True, env=env)
-        logging.info("[%s] Results stored.", name)
-
+    # The global and project level arguments are the same for every
+    # configuration, merge them only once.
+    project_args = {arg_name: collect_args(arg_name,
+                                           [config["CodeChecker"], project])
+                    for arg_name in ARG_NAMES}
+    # Leaving the block waits for the submitted stores, even if the
+    # analysis of a configuration raises.
+    with ThreadPoolExecutor(max_workers=1) as store_executor:
+        stores = []
+        for run_config in project["configurations"]:
+            result_dir = "cc_results"
+            if run_config["name"]:
+                result_dir += "_" + run_config["name"]
+            result_path = os.path.join(project_dir, result_dir)
+            run_config["result_path"] = result_path
+
+            run_args = {arg_name: collect_args(arg_name,
+                                               [project_args, run_config])
+                        for arg_name in ARG_NAMES}
+            sa_args = run_args["clang_sa_args"]
+            if run_config.get("coverage", False):
+                coverage_dir = result_path + "/coverage"
+                run_config["coverage_dir"] = coverage_dir
+                sa_args += (" -Xclang -analyzer-config "
+                            "-Xclang record-coverage=%s " % coverage_dir)
+            sa_args_file = make_args_file(sa_args)
+
+            tidy_args_file = make_args_file(
+                run_args["clang_tidy_args"])
+
+            tag = project.get("tag")
+            name = project["name"]
+            if tag:
+                name += "_" + tag
+            if run_config["name"]:
+                name += "_" + run_config["name"]
+            run_config["full_name"] = name
+
+            logging.info("[%s] Analyzing project... ", name)
+            env = None
+            if "clang_path" in run_config:
+                env = update_path(run_config["clang_path"])
+            run_config["analyzer_version"] = get_clang_version(
+                run_config.get("clang_path", ""), env)
+            analyzers = config["CodeChecker"].get("analyzers", "clangsa")
+            cmd = ["CodeChecker", "analyze", json_path, "-j%d" % num_jobs,
+                   "-o", result_path, "-q", "--analyzers"] + \
+                analyzers.split() + ["--capture-analysis-output"]
+            if sa_args_file:
+                cmd += ["--saargs", sa_args_file]
+            if tidy_args_file:
+                cmd += ["--tidyargs", tidy_args_file]
+            cmd += ["--skip", skippath]
+            cmd += shlex.split(run_args["analyze_args"])
+
+            digest = analysis_digest(
+                json_path, revision,
+                [config.get("CodeChecker version", ""),
+                 run_config["analyzer_version"], analyzers, sa_args,
+                 run_args["clang_tidy_args"], run_args["analyze_args"],
+                 "\n".join(project.get("skip", []))])
+            digest_path = result_path + "/.digest"
+            if digest and read_digest(digest_path) == digest and \
+                    has_reports(result_path):
+                logging.info("[%s] Sources and configuration are unchanged, "
+                             "reusing previous results.", name)
+            else:
+                # The results of an earlier revision must not be mixed into the
+                # new ones.
+                shutil.rmtree(result_path, ignore_errors=True)
+                failed, _, _ = run_command(cmd, print_error=True, env=env)
+                # Failing to analyze some of the translation units (3) is
+                # part of the result.
+                if digest and failed in (0, 3):
+                    with open(digest_path, 'w') as digest_file:
+                        digest_file.write(digest)
+            for args_file in (sa_args_file, tidy_args_file):
+                if args_file:
+                    os.remove(args_file)
+
+            logging.info("[%s] Done. Storing results in the background...",
+                         name)
+            cmd = ["CodeChecker", "store", result_path,
+                   "--url", config["CodeChecker"]["url"], "-n", name]
+            if tag:
+                cmd += ["--tag", tag]
+            cmd += shlex.split(run_args["store_args"])
+            # Storing is network bound, the analysis of the next configuration
+            # can run in the meantime.
+            stores.append(store_executor.submit(store_results, cmd, env, name))
+
+        for store in stores:
+            store.result()
     os.remove(skippath)
 
 
+# Patterns of the interesting lines in the output of the analyzer. The
+# failure zips are scanned as bytes.
+WARNING_PATTERN = re.compile(r'warning: (.+)')
+FAILURE_PATTERNS = {
+    "warnings": (re.compile(rb'warning: (.+)'), b'warning: '),
+    "compilation errors": (re.compile(rb'error: (.+)'), b'error: '),
+    "assertions": (re.compile(rb'(Assertion.+failed\.)'), b'Assertion'),
+    "unreachable": (re.compile(rb'UNREACHABLE executed at (.+)'),
+                    b'UNREACHABLE')
+}
+
+
+ZIP_READ_BUFFER = 64 * 1024
+
+
 class RegexStat:
-    def __init__(self, regex: str):
+    def __init__(self, regex: Union[str, bytes, re.Pattern],
+                 literal: Optional[Union[str, bytes]] = None):
         self.regex = re.compile(regex)
+        # A substring of every match. Most lines do not contain it, and
+        # checking it is much cheaper than running the regex.
+        self.literal = literal
         self.counter = Counter()
 
+    def search(self, line: Union[str, bytes]) -> Optional[re.Match]:
+        if self.literal is not None and self.literal not in line:
+            return None
+        return self.regex.search(line)
+
 
 def process_success(path: str, statistics: Optional[dict] = None) -> dict:
     if statistics is None:
         statistics = dict()
     statistics.update({
-        "warnings": RegexStat(r'warning: (.+)')
+        "warnings": RegexStat(WARNING_PATTERN, 'warning: ')
     })
     if not os.path.exists(path):
         return statistics
-    for name in os.listdir(path):
-        if not name.endswith(".txt"):
-            continue
-        with open(os.path.join(path, name), encoding="utf-8",
-                  errors="ignore") as compiler_output:
-            for line in compiler_output:
-                for _, stat in statistics.items():
-                    match = stat.regex.search(line)
-                    if match:
-                        stat.counter[match.group(1)] += 1
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".txt"):
+                continue
+            with open(entry.path, encoding="utf-8",
+                      errors="ignore") as compiler_output:
+                for line in compiler_output:
+                    for _, stat in statistics.items():
+                        match = stat.search(line)
+                        if match:
+                            stat.counter[match.group(1)] += 1
     return statistics
 
 
@@ -440,27 +907,30 @@ def process_failures(path: str, statistics: Optional[dict] = None) \
     -> Tuple[int, dict]:
     if statistics is None:
         statistics = dict()
-    statistics.update({
-        "warnings": RegexStat(r'warning: (.+)'),
-        "compilation errors": RegexStat(r'error: (.+)'),
-        "assertions": RegexStat(r'(Assertion.+failed\.)'),
-        "unreachable": RegexStat(r'UNREACHABLE executed at (.+)')
-    })
+    statistics.update({name: RegexStat(regex, literal)
+                       for name, (regex, literal) in FAILURE_PATTERNS.items()})
     if not os.path.exists(path):
         return 0, statistics
     failures = 0
-    for name in os.listdir(path):
-        if not name.endswith(".zip"):
-            continue
-        failures += 1
-        full_path = os.path.join(path, name)
-        with zipfile.ZipFile(full_path) as archive, \
-                archive.open("stderr") as stderr:
-            for line in TextIOWrapper(stderr, 'utf-8'):
-                for _, stat in statistics.items():
-                    match = stat.regex.search(line)
-                    if match:
-                        stat.counter[match.group(1)] += 1
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".zip"):
+                continue
+            failures += 1
+            # The zip entry is decompressed in small chunks by default,
+            # read it through a larger buffer.
+            with zipfile.ZipFile(entry.path) as archive, \
+                    archive.open("stderr") as raw_stderr, \
+                    io.BufferedReader(raw_stderr,
+                                      buffer_size=ZIP_READ_BUFFER) as stderr:
+                # The patterns are matched against the raw bytes, only the
+                # matching parts are decoded.
+                for line in stderr:
+                    for _, stat in statistics.items():
+                        match = stat.search(line)
+                        if match:
+                            stat.counter[match.group(1).rstrip(b"\r").decode(
+                                "utf-8", "replace")] += 1
 
     return failures, statistics
 
@@ -469,65 +939,213 @@ def create_link(url: str, text: str) -> str:
     return '<a href="%s">%s</a>' % (url, text)
 
 
+def get_runs(url: str, names: Sequence[str]) -> dict:
+    """
+    Queries the given runs from the CodeChecker server with a single
+    request, and returns them by name. The filtering is done by the
+    server, so the response does not grow with the number of stored runs.
+    """
+    _, stdout, _ = run_command(["CodeChecker", "cmd", "runs", "-n", *names,
+                                "--url", url, "-o", "json"],
+                               capture_stdout=True)
+    try:
+        runs = json.loads(stdout)
+    except ValueError:
+        return {}
+    # The name filter also matches runs having the name as a substring.
+    wanted = set(names)
+    return {name: data for run in runs for name, data in run.items()
+            if name in wanted}
+
+
+def scan_result_dir(result_path: str) -> Tuple[int, int]:
+    """
+    Returns the number of plist files directly under result_path and the
+    disk usage of the whole directory, using a single traversal.
+    """
+    plist_count = 0
+    disk_usage = 0
+    dirs = [result_path]
+    while dirs:
+        current = dirs.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                    continue
+                if current == result_path and entry.name.endswith(".plist"):
+                    plist_count += 1
+                disk_usage += entry.stat().st_size
+    return plist_count, disk_usage
+
+
+def run_gcovr(args: Sequence[str]) -> None:
+    """
+    Runs gcovr in-process if it is importable, to avoid starting another
+    Python interpreter, otherwise falls back to the command in the PATH.
+    """
+    if not GCOVR_SUPPORTED:
+        if shutil.which("gcovr"):
+            run_command(["gcovr"] + list(args))
+        else:
+            logging.warning("gcovr is not found in path.")
+        return
+    try:
+        retcode = gcovr_main(list(args))
+    except SystemExit as exit_request:
+        retcode = exit_request.code
+    if retcode:
+        logging.error("gcovr failed with exit code %s.", retcode)
+
+
+def process_coverage(run_config: dict, project_dir: str) -> Optional[dict]:
+    """
+    Merges the recorded coverage of a configuration, then creates the HTML
+    report and the summary from the merged gcov files. Returns the summary,
+    or None if the coverage could not be merged.
+    """
+    result_path = run_config["result_path"]
+    cov_result_path = result_path + "/coverage_merged"
+    if not shutil.which("MergeCoverage.py"):
+        logging.warning("MergeCoverage.py is not found in path.")
+        return None
+    failed, _, _ = run_command(["MergeCoverage.py", "-i",
+                                run_config["coverage_dir"],
+                                "-o", cov_result_path])
+    if failed:
+        return None
+    # gcovr reads the already merged gcov files as they are (-g -k), so
+    # neither gcov nor the merge is rerun for the report.
+    run_gcovr(["-k", "-g", cov_result_path, "--html", "--html-details",
+               "-r", project_dir, "-o",
+               result_path + "/coverage.html"])
+    cov_summary = summarize_gcov(cov_result_path)
+    with open(result_path + "/coverage.txt", "w", encoding="utf-8",
+              errors="ignore") as cov_file:
+        json.dump(cov_summary, cov_file, indent=2)
+    return cov_summary
+
+
+def encode_stat(value):
+    if isinstance(value, timedelta):
+        return {"__timedelta__": value.total_seconds()}
+    raise TypeError("Cannot encode %r" % value)
+
+
+def decode_stat(value: dict):
+    if "__timedelta__" in value:
+        return timedelta(seconds=value["__timedelta__"])
+    return value
+
+
+def append_stats(stats_path: str, name: str, stats: dict) -> None:
+    """
+    Appends the statistics of a project to the log read by write_report.
+    The record is written with a single write to a file opened in append
+    mode, so the workers do not need to synchronize.
+    """
+    record = json.dumps({"name": name, "stats": stats},
+                        default=encode_stat) + "\n"
+    handle = os.open(stats_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try:
+        os.write(handle, record.encode("utf-8"))
+    finally:
+        os.close(handle)
+
+
+def write_report(stats_html: str, stats_path: str, config: dict) -> None:
+    """Creates the HTML report from the logged project statistics."""
+    project_stats = {}
+    with open(stats_path, encoding="utf-8", errors="ignore") as stats_file:
+        for line in stats_file:
+            record = json.loads(line, object_hook=decode_stat)
+            project_stats[record["name"]] = record["stats"]
+    # Keep the order of the configuration file, regardless of the order in
+    # which the projects were finished.
+    with HTMLPrinter(stats_html, config) as printer:
+        for project in config['projects']:
+            if project['name'] in project_stats:
+                printer.extend_with_project(project['name'],
+                                            project_stats[project['name']])
+
+
 def post_process_project(project: dict, project_dir: str, config: dict,
-                         printer: HTMLPrinter) -> int:
-    _, stdout, _ = run_command(
-        "CodeChecker cmd runs --url %s -o json" % config['CodeChecker']['url'])
-    runs = json.loads(stdout)
+                         stats_path: str,
+                         pool: Optional[ProcessPoolExecutor] = None) \
+        -> Optional[int]:
+    """
+    Collects the statistics of a project and logs them for the report.
+    The statistics are collected in the given process pool if any, as it
+    is CPU bound Python code that would otherwise compete for the GIL.
+
+    Returns the number of fatal errors, or None if the worker process
+    collecting the statistics died. Once a worker died, the pool cannot be
+    used anymore, the later projects are post-processed in their thread.
+    """
+    args = (project, project_dir, config)
+    try:
+        collection = pool.submit(collect_project_stats, *args) if pool \
+            else None
+    except BrokenProcessPool:
+        collection = None
+    if collection is not None:
+        try:
+            project_stats, fatal_errors = collection.result()
+        except BrokenProcessPool:
+            logging.error("[%s] A worker process died while post-processing "
+                          "the project.", project['name'])
+            return None
+    else:
+        project_stats, fatal_errors = collect_project_stats(*args)
+    append_stats(stats_path, project["name"], project_stats)
+    logging.info("[%s] Postprocessed.", project['name'])
+    return fatal_errors
+
+
+def collect_project_stats(project: dict, project_dir: str,
+                          config: dict) -> Tuple[dict, int]:
     project_stats = {}
     fatal_errors = 0
+    runs = get_runs(config['CodeChecker']['url'],
+                    [run_config['full_name']
+                     for run_config in project["configurations"]])
     for run_config in project["configurations"]:
-        cov_result_html = None
+        cov_summary = None
         if run_config.get("coverage", False) and \
            os.path.isdir(run_config["coverage_dir"]):
-            cov_result_path = os.path.join(
-                run_config["result_path"], "coverage_merged")
-            try:
-                run_command("MergeCoverage.py -i '%s' -o '%s'" %
-                            (run_config["coverage_dir"], cov_result_path))
-            except OSError:
-                logging.warning("MergeCoverage.py is not found in path.")
-            cov_result_html = os.path.join(
-                run_config["result_path"], "coverage.html")
-            try:
-                run_command(
-                    "gcovr -k -g '%s' --html --html-details -r '%s' -o '%s'" %
-                    (cov_result_path, project_dir, cov_result_html))
-            except OSError:
-                logging.warning("gcovr is not found in path.")
-            cov_summary = summarize_gcov(cov_result_path)
-            cov_summary_path = os.path.join(
-                run_config["result_path"], "coverage.txt")
-            with open(cov_summary_path, "w", encoding="utf-8",
-                      errors="ignore") as cov_file:
-                cov_file.write(json.dumps(cov_summary, indent=2))
-
-        stats_dir = os.path.join(run_config["result_path"], "success")
-        failed_dir = os.path.join(run_config["result_path"], "failed")
+            cov_summary = process_coverage(run_config, project_dir)
+
+        result_path = run_config["result_path"]
+        stats_dir = result_path + "/success"
+        failed_dir = result_path + "/failed"
 
         # Statistics from the Analyzer engine (if enabled).
         stats = summ_stats(stats_dir, False)
 
         # Additional statistics.
         stats["Analyzer version"] = run_config["analyzer_version"]
-        if cov_result_html:
+        if cov_summary:
             stats["Detailed coverage link"] = create_link(
-                cov_result_html, "coverage")
+                result_path + "/coverage.html", "coverage")
             stats["Coverage"] = cov_summary["overall"]["coverage"]
-        for run in runs:
-            if run_config['full_name'] in run:
-                run = run[run_config['full_name']]
-                break
-        stats["Result count"] = run["resultCount"]
-        stats["Duration"] = timedelta(seconds=run["duration"])
+        run = runs.get(run_config['full_name'])
+        if run:
+            stats["Result count"] = run["resultCount"]
+            stats["Duration"] = timedelta(seconds=run["duration"])
+        else:
+            logging.warning("[%s] Run not found on the server.",
+                            run_config['full_name'])
         stats["CodeChecker link"] = \
             create_link("%s/#run=%s&tab=%s" % (config['CodeChecker']['url'],
                                                run_config['full_name'],
                                                run_config['full_name']),
                         "CodeChecker")
-        stats["Successfully analyzed"] = \
-            len([name for name in os.listdir(run_config["result_path"])
-                 if name.endswith(".plist")])
+        plist_count, disk_usage = scan_result_dir(result_path)
+        stats["Successfully analyzed"] = plist_count
         success_stats = process_success(stats_dir)
         failure_num, failure_stats = process_failures(failed_dir)
         failure_stats["warnings"].counter += success_stats["warnings"].counter
@@ -541,18 +1159,86 @@ def post_process_project(project: dict, project_dir: str, config: dict,
             sum(failure_stats["unreachable"].counter.values())
         stats["Lines of code"] = project.get("LOC", '?')
 
-        disk_usage = 0
-        for path, _, files in os.walk(run_config['result_path']):
-            for f in files:
-                disk_usage += os.path.getsize(os.path.join(path, f))
-
         stats["Disk usage"] = disk_usage
 
         project_stats[run_config["name"]] = stats
 
-    printer.extend_with_project(project["name"], project_stats)
-    logging.info("[%s] Postprocessed.", project['name'])
-    return fatal_errors
+    return project_stats, fatal_errors
+
+
+def checkout_project(project: dict, projects_root: str,
+                     use_cache: bool = True) -> bool:
+    """Checks out a project, removing what was checked out on failure."""
+    project_dir = os.path.join(projects_root, project['name'])
+    source_dir = os.path.join(project_dir, project.get('source_dir', ''))
+    if clone_project(project, project_dir, source_dir, use_cache=use_cache):
+        return True
+    shutil.rmtree(project_dir, ignore_errors=True)
+    return False
+
+
+def process_project(project: dict, projects_root: str, config: dict,
+                    num_jobs: int, stats_path: str,
+                    checkout: Optional["Future[bool]"] = None,
+                    pool: Optional[ProcessPoolExecutor] = None,
+                    stop: Optional[threading.Event] = None) \
+        -> Optional[int]:
+    """Runs the pipeline for a single project once it is checked out.
+
+    The checkout of the projects is started separately, so the network
+    bound checkouts of the later projects overlap with the builds and
+    analyses of the earlier ones. Packages are downloaded by their build.
+
+    The project is abandoned before its next stage once stop is set.
+
+    Returns the number of fatal errors (assertions, unreachables) found,
+    or None if the project could not be built, post-processed or was
+    stopped.
+    """
+    def stopped() -> bool:
+        if stop is None or not stop.is_set():
+            return False
+        logging.info("[%s] Stopped.", project['name'])
+        return True
+
+    project_dir = os.path.join(projects_root, project['name'])
+    source_dir = os.path.join(project_dir, project.get('source_dir', ''))
+    if stopped():
+        return None
+    if project.get('package'):
+        build_package(project, project_dir, num_jobs)
+    else:
+        if not checkout.result() or stopped():
+            return None
+        if not log_project(project, source_dir, num_jobs):
+            return None
+    if stopped():
+        return None
+    # The revision is of the whole checkout, not only the source_dir.
+    check_project(project, source_dir, config, num_jobs,
+                  source_revision(project, project_dir))
+    return post_process_project(project, source_dir, config, stats_path,
+                                pool)
+
+
+def post_process_pool(processes: int) \
+        -> ContextManager[Optional[ProcessPoolExecutor]]:
+    """
+    Creates the process pool for post-processing. Forking is cheap only on
+    Linux, elsewhere the projects are post-processed in their own thread.
+    The pool must be created before any other thread is started.
+
+    Unlike multiprocessing.Pool, the executor fails the pending tasks if a
+    worker dies, instead of waiting for them forever.
+    """
+    if sys.platform != "linux":
+        return nullcontext()
+    pool = ProcessPoolExecutor(processes,
+                               mp_context=multiprocessing.get_context("fork"))
+    # The workers are forked by the first submission, do it while this is
+    # the only thread.
+    pool.submit(int).result()
+    return pool
 
 
 def main():
@@ -574,57 +1260,109 @@ def main():
     parser.add_argument("-o", "--output", metavar="RESULT_DIR",
                         dest='output', default='projects',
                         help="Directory where results should be generated")
+    parser.add_argument("--concurrency", metavar="PROJECTS", type=int,
+                        help="number of projects processed at the same "
+                             "time\n(default: as many as the number of "
+                             "jobs allows)")
+    parser.add_argument("--loc-tool", dest='loc_tool', choices=LOC_TOOLS,
+                        help="tool used to count the lines of code\n"
+                             "(default: the first one in the path)")
+    parser.add_argument("--no-cache", dest='no_cache', action='store_true',
+                        help="Clone the projects directly from their remote "
+                             "instead of\nusing the mirrors in '%s'"
+                             % MIRROR_CACHE_DIR)
     args = parser.parse_args()
 
     try:
-        _, cc_ver, _ = run_command("CodeChecker version")
+        _, cc_ver, _ = run_command(["CodeChecker", "version"],
+                                   capture_stdout=True)
     except OSError:
         logging.error("CodeChecker is not available as a command.")
         sys.exit(1)
 
     if args.jobs < 1:
         logging.error("Invalid number of jobs.")
+        sys.exit(1)
+
+    if args.concurrency is not None and args.concurrency < 1:
+        logging.error("Invalid number of concurrent projects.")
+        sys.exit(1)
+
+    loc_tool = args.loc_tool or find_loc_tool()
+    if not loc_tool:
+        logging.warning("None of %s is found in path, the lines of code "
+                        "are not counted.", ", ".join(LOC_TOOLS))
+    elif not shutil.which(loc_tool):
+        logging.error("%s is not found in path.", loc_tool)
+        sys.exit(1)
 
     logging.info("Using configuration file '%s'.", args.config)
     config = load_config(args.config)
     config["CodeChecker version"] = cc_ver
     script_dir = os.path.dirname(os.path.realpath(__file__))
-    _, out, _ = run_command("git rev-parse HEAD", False, cwd=script_dir)
+    _, out, _ = run_command(["git", "rev-parse", "HEAD"], False,
+                            cwd=script_dir, capture_stdout=True)
     config["Script version"] = out
     config["Script args"] = " ".join(sys.argv)
     logging.info("Number of projects to process: %d.\n",
                  len(config['projects']))
+    for project in config['projects']:
+        project.setdefault('loc_tool', loc_tool)
+        if project['loc_tool'] and project['loc_tool'] not in LOC_TOOLS:
+            logging.error("[%s] Unknown 'loc_tool' '%s', it must be one of "
+                          "%s.", project['name'], project['loc_tool'],
+                          ", ".join(LOC_TOOLS))
+            sys.exit(1)
 
     projects_root = os.path.abspath(args.output)
     make_dir(projects_root)
 
     stats_html = os.path.join(projects_root, "stats.html")
-    with HTMLPrinter(stats_html, config) as printer:
-
-        for project in config['projects']:
-            project_dir = os.path.join(projects_root, project['name'])
-            source_dir = os.path.join(project_dir,
-                                      project.get('source_dir', ''))
-            package = project.get('package')
-            if package:
-                build_package(project, project_dir, args.jobs)
-            else:
-                if not clone_project(project, project_dir, source_dir):
-                    try:
-                        shutil.rmtree(project_dir)
-                    except:
-                        pass
-                    continue
-                if not log_project(project, source_dir, args.jobs):
+    stats_path = os.path.join(projects_root, "stats.jsonl")
+    open(stats_path, 'w').close()
+    # The projects are independent and most of the work is done by external
+    # processes, so they are processed in parallel. The jobs are divided
+    # between the projects to avoid oversubscribing the machine.
+    num_workers = max(1, min(len(config['projects']),
+                             args.concurrency or args.jobs))
+    jobs_per_project = max(1, args.jobs // num_workers)
+    stop = threading.Event()
+    try:
+        with post_process_pool(num_workers) as pool, \
+                ThreadPoolExecutor(max_workers=num_workers) \
+                as checkout_executor, \
+                ThreadPoolExecutor(max_workers=num_workers) as executor:
+            checkouts = [None if project.get('package') else
+                         checkout_executor.submit(checkout_project, project,
+                                                  projects_root,
+                                                  not args.no_cache)
+                         for project in config['projects']]
+            futures = [executor.submit(process_project, project,
+                                       projects_root, config,
+                                       jobs_per_project, stats_path,
+                                       checkout, pool, stop)
+                       for project, checkout in zip(config['projects'],
+                                                    checkouts)]
+            logged_projects = 0
+            for future in as_completed(futures):
+                fatal_errors = future.result()
+                if fatal_errors is None:
                     continue
-            check_project(project, source_dir, config, args.jobs)
-            fatal_errors = post_process_project(project, source_dir, config,
-                                                printer)
-            if fatal_errors > 0 and args.fail_on_assert:
-                logging.error('Stopping after assertion failure.')
-                sys.exit(1)
-
-    logged_projects = check_logged(projects_root, config['projects'])
+                logged_projects += 1
+                if fatal_errors > 0 and args.fail_on_assert:
+                    # The running stages of the other projects cannot be
+                    # interrupted, those are waited for.
+                    logging.error('Stopping after assertion failure, '
+                                  'waiting for the running stages of the '
+                                  'other projects to finish.')
+                    stop.set()
+                    checkout_executor.shutdown(wait=False,
+                                               cancel_futures=True)
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    sys.exit(1)
+    finally:
+        write_report(stats_html, stats_path, config)
+
     logging.info("\nNumber of analyzed projects: %d / %d\n"
                  "Results can be viewed at '%s'.\n"
                  "Stats can be viewed at 'file://%s'.",
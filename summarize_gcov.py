@@ -1,50 +1,88 @@
 #!/usr/bin/env python3
 
+import mmap
+import multiprocessing
 import os
+import re
 import sys
+from collections import Counter
 
+# The execution count before the first colon of a line, the rest of the line
+# is the source code.
+COUNT_PATTERN = re.compile(rb"^[ \t]*([^:\n]*?)[ \t]*:", re.MULTILINE)
 
-def summarize_gcov(path: str):
+
+def summarize_gcov_file(file_path: str):
+    # The file is mapped and scanned by the regex engine directly, without
+    # decoding or splitting it into lines. The lines are counted per
+    # distinct execution count, so the counts are parsed and accumulated
+    # only once.
+    with open(file_path, "rb") as content:
+        if os.fstat(content.fileno()).st_size:
+            with mmap.mmap(content.fileno(), 0,
+                           access=mmap.ACCESS_READ) as data:
+                counts = Counter(COUNT_PATTERN.findall(data))
+        else:
+            counts = Counter()
+    file_max = 0
+    file_sum = 0
+    file_covered = 0
+    file_missed = 0
+    file_noop = 0
+    # The kind of a line is decided by the first character of its count:
+    # '#####' is a missed line, '-' is not executable, and a number is the
+    # execution count, possibly followed by a '*' if some of its blocks
+    # were not executed. Anything else is not a source line.
+    for value, lines in counts.items():
+        first = value[:1]
+        if first == b"#":
+            file_missed += lines
+            continue
+        if first == b"-":
+            file_noop += lines
+            continue
+        if not first.isdigit():
+            continue
+        value = int(value.rstrip(b"*"))
+        file_covered += lines
+        file_sum += value * lines
+        if value > file_max:
+            file_max = value
+    file_all = max(file_covered + file_missed, 1)
+    return {"max": file_max, "coverage": file_covered / file_all,
+            "sum": file_sum, "missed": file_missed, "covered": file_covered,
+            "average": file_sum / file_all, "noop": file_noop}
+
+
+def summarize_gcov(path: str, jobs: int = 1):
+    """
+    Summarizes the gcov files under path. The files are parsed by a pool
+    of jobs processes if more than one is requested; this is not possible
+    from the daemonic workers of another pool.
+    """
     summary = {}
     overall_sum = 0
     overall_missed = 0
     overall_noop = 0
     overall_covered = 0
     overall_max = 0
-    for root, _, files in os.walk(path):
-        for gcov_file in files:
-            if not gcov_file.endswith(".gcov"):
-                continue
-            file_path = os.path.join(root, gcov_file)
-            file_max = 0
-            file_sum = 0
-            file_covered = 0
-            file_missed = 0
-            file_noop = 0
-            with open(file_path) as content:
-                for line in content:
-                    value = line.split(":")[0]
-                    if value == "#####":
-                        file_missed += 1
-                        continue
-                    if value == "-":
-                        file_noop += 1
-                        continue
-                    value = int(value)
-                    file_covered += 1
-                    file_sum += value
-                    if value > file_max:
-                        file_max = value
-            file_all = max(file_covered + file_missed, 1)
-            summary[file_path] = {"max": file_max, "coverage": file_covered / file_all,
-                                  "sum": file_sum, "missed": file_missed, "covered": file_covered,
-                                  "average": file_sum / file_all, "noop": file_noop}
-            if file_max > overall_max:
-                overall_max = file_max
-            overall_covered += file_covered
-            overall_missed += file_missed
-            overall_noop += file_noop
-            overall_sum += file_sum
+    file_paths = [os.path.join(root, gcov_file)
+                  for root, _, files in os.walk(path)
+                  for gcov_file in files if gcov_file.endswith(".gcov")]
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            file_summaries = pool.map(summarize_gcov_file, file_paths,
+                                      chunksize=32)
+    else:
+        file_summaries = map(summarize_gcov_file, file_paths)
+    for file_path, file_summary in zip(file_paths, file_summaries):
+        summary[file_path] = file_summary
+        if file_summary["max"] > overall_max:
+            overall_max = file_summary["max"]
+        overall_covered += file_summary["covered"]
+        overall_missed += file_summary["missed"]
+        overall_noop += file_summary["noop"]
+        overall_sum += file_summary["sum"]
     overall_all = max(overall_covered + overall_missed, 1)
     summary["overall"] = {"max": overall_max, "coverage": overall_covered / overall_all,
                           "sum": overall_sum, "missed": overall_missed, "covered": overall_covered,
@@ -54,6 +92,6 @@ def summarize_gcov(path: str):
 
 if __name__ == "__main__":
     import json
-    res = summarize_gcov(sys.argv[1])
+    res = summarize_gcov(sys.argv[1], multiprocessing.cpu_count())
     with open(sys.argv[2], "w") as f:
         json.dump(res, f, indent=2)
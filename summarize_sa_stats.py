@@ -3,13 +3,21 @@
 import os
 import re
 import sys
-from collections import defaultdict
+from collections import Counter, defaultdict
 from enum import Enum
+from functools import lru_cache
 from math import floor, log10
-from typing import Sequence
+from typing import Tuple
 
 
-def dice_coefficient(a: Sequence, b: Sequence) -> float:
+# The same statistic names are compared over and over again, for every
+# block of every file.
+@lru_cache(maxsize=4096)
+def bigrams(text: str) -> Counter:
+    return Counter(text[i:i + 2] for i in range(len(text) - 1))
+
+
+def dice_coefficient(a: str, b: str) -> float:
     if not a or not b:
         return 0.0
     # Quick case for true duplicates.
@@ -19,29 +27,19 @@ def dice_coefficient(a: Sequence, b: Sequence) -> float:
     if len(a) == 1 or len(b) == 1:
         return 0.0
 
-    # Use python list comprehension, preferred over list.append().
-    a_bigram_list = [a[i:i + 2] for i in range(len(a) - 1)]
-    b_bigram_list = [b[i:i + 2] for i in range(len(b) - 1)]
-
-    a_bigram_list.sort()
-    b_bigram_list.sort()
-
-    lena = len(a_bigram_list)
-    lenb = len(b_bigram_list)
-    matches = i = j = 0
-    while i < lena and j < lenb:
-        if a_bigram_list[i] == b_bigram_list[j]:
-            matches += 2
-            i += 1
-            j += 1
-        elif a_bigram_list[i] < b_bigram_list[j]:
-            i += 1
-        else:
-            j += 1
-    score = matches / (lena + lenb)
+    # The number of common bigrams is the size of the multiset intersection.
+    matches = 2 * sum((bigrams(a) & bigrams(b)).values())
+    score = matches / (len(a) + len(b) - 2)
     return score
 
 
+# The blocks of the different files usually contain the same statistics.
+@lru_cache(maxsize=None)
+def best_match(name: str, candidates: Tuple[str, ...]) -> str:
+    """Returns the candidate that is the most similar to name."""
+    return max(candidates, key=lambda x: dice_coefficient(x, name))
+
+
 # The different type of statistics and their corresponding pattern.
 class StatType(Enum):
     NUM = '#'
@@ -49,6 +47,19 @@ class StatType(Enum):
     MAX = 'maximum'
 
 
+# The statistics are printed as right aligned numbers, and the timers as a
+# table row, both at the beginning of the line. The literals are substrings
+# of every match, checking them rules out most lines without running the
+# regexes.
+STAT_LITERAL = " - The "
+STAT_PATTERN = re.compile(
+    r"\s*([0-9]+(?:\.[0-9]+)?) (.+) - (The (%s) .+)"
+    % "|".join(t.value for t in StatType))
+TIMER_LITERAL = ")"
+TIMER_PATTERN = re.compile(r".+\(.+\).+\(.+\).+\(.+\)(.+)\(.+\).+analyzer total time",
+                           re.IGNORECASE)
+
+
 def summ_stats(path: str, verbose: bool = True) -> dict:
     stat_map = defaultdict(int)
     per_helper = defaultdict(int)
@@ -64,14 +75,18 @@ def summ_stats(path: str, verbose: bool = True) -> dict:
 
     if verbose:
         # Print the content of stat_map in a formatted way grouped by the statistic producing file.
-        last_space = floor(log10(max(stat_map.values()))) + 1
+        # Only the statistics are printed, not the list of TU times. The
+        # values can be zero, those are printed with a single digit.
+        last_space = floor(log10(max([stat_map[key] for key in group] +
+                                     [1]))) + 1
         for key in sorted(group.keys(), key=(lambda x: group[x])):
             val = stat_map[key]
             if isinstance(val, float):
-                num_of_spaces = int(last_space - floor(log10(int(val)))) - 4
+                num_of_spaces = int(last_space -
+                                    floor(log10(max(int(val), 1)))) - 4
                 sys.stdout.write("{0:.3f}".format(val))
             else:
-                num_of_spaces = int(last_space - floor(log10(val)))
+                num_of_spaces = int(last_space - floor(log10(max(val, 1))))
                 sys.stdout.write(str(val))
             print(' ' * num_of_spaces + '- ' + key)
 
@@ -80,57 +95,53 @@ def summ_stats(path: str, verbose: bool = True) -> dict:
 
 def summ_stats_on_file(filename: str, stat_map: dict, per_helper: dict,
                        group: dict) -> None:
-    type_pattern = ''
-    for t in StatType:
-        type_pattern += t.value + '|'
-    type_pattern = type_pattern[:-1]
-    stat_pattern = re.compile(
-        r"([0-9]+(?:\.[0-9]+)?) (.+) - (The (" + type_pattern + r") .+)")
-    timer_pattern = re.compile(r".+\(.+\).+\(.+\).+\(.+\)(.+)\(.+\).+analyzer total time",
-                               re.IGNORECASE)
     act_nums = {}
     per_to_num_map = {}
     per_to_update = {}
     is_in_stat_block = False
-    f = open(filename)
-    lines = f.readlines()
-    for line in lines:
-        m = timer_pattern.search(line)
-        if m:
-            val = float(m.group(1).strip())
-            if "TU times" in stat_map:
-                stat_map["TU times"].append(val)
-            else:
-                stat_map["TU times"] = [val]
-        m = stat_pattern.search(line)
-        if m:
-            is_in_stat_block = True
-            stat_type = StatType(m.group(4))
-            stat_name = m.group(3)
-            stat_val = m.group(1)
-            group[stat_name] = m.group(2)
-            if stat_type == StatType.NUM:
-                stat_map[stat_name] += int(stat_val)
-                act_nums[stat_name] = int(stat_val)
-            elif stat_type == StatType.MAX:
-                stat_map[stat_name] = max(stat_map[stat_name], int(stat_val))
-            elif stat_type == StatType.PER:
-                per_to_update[stat_name] = stat_val
-        # When all the other statistics has been processed (to a file) than check the % stats.
-        elif is_in_stat_block:
-            is_in_stat_block = False
-            for key, val in per_to_update.items():
-                # Find the most similar # stat.
-                num_data = max(act_nums.keys(), key=(
-                    lambda x: dice_coefficient(x, key)))
-                per_helper[num_data] += int(act_nums[num_data] * float(val))
-                # Check for consistency.
-                assert not (
-                    key in per_to_num_map and per_to_num_map[key] != num_data)
-                per_to_num_map[key] = num_data
-                stat_map[key] = floor(
-                    per_helper[num_data]) / stat_map[num_data]
-            act_nums = {}
+    # Local names are faster to look up in the loop over every line.
+    match_timer = TIMER_PATTERN.match
+    match_stat = STAT_PATTERN.match
+    num_type, max_type, per_type = StatType.NUM, StatType.MAX, StatType.PER
+    with open(filename) as stat_file:
+        for line in stat_file:
+            m = TIMER_LITERAL in line and match_timer(line)
+            if m:
+                val = float(m.group(1).strip())
+                if "TU times" in stat_map:
+                    stat_map["TU times"].append(val)
+                else:
+                    stat_map["TU times"] = [val]
+            m = STAT_LITERAL in line and match_stat(line)
+            if m:
+                is_in_stat_block = True
+                stat_val, group_name, stat_name, type_value = m.groups()
+                stat_type = StatType(type_value)
+                group[stat_name] = group_name
+                if stat_type is num_type:
+                    stat_val = int(stat_val)
+                    stat_map[stat_name] += stat_val
+                    act_nums[stat_name] = stat_val
+                elif stat_type is max_type:
+                    stat_val = int(stat_val)
+                    if stat_val > stat_map[stat_name]:
+                        stat_map[stat_name] = stat_val
+                elif stat_type is per_type:
+                    per_to_update[stat_name] = stat_val
+            # When all the other statistics has been processed (to a file) than check the % stats.
+            elif is_in_stat_block:
+                is_in_stat_block = False
+                for key, val in per_to_update.items():
+                    # Find the most similar # stat.
+                    num_data = best_match(key, tuple(act_nums))
+                    per_helper[num_data] += int(act_nums[num_data] * float(val))
+                    # Check for consistency.
+                    assert not (
+                        key in per_to_num_map and per_to_num_map[key] != num_data)
+                    per_to_num_map[key] = num_data
+                    stat_map[key] = floor(
+                        per_helper[num_data]) / max(stat_map[num_data], 1)
+                act_nums = {}
 
 
 def main(argv):
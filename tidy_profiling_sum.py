@@ -1,15 +1,16 @@
 #!/usr/bin/env python3
 import argparse
-from collections import OrderedDict
-import copy
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
 import csv
+import functools
 import hashlib
 import itertools
 import json
 import logging
 import os
 import sys
-from typing import Optional
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import generate_stat_html as stat_html
 
@@ -49,66 +50,131 @@ except ImportError:
     __HAS_CHARTS = False
 
 
+try:
+    import ijson
+    __HAS_IJSON = True
+    __PARSE_ERRORS = (ValueError, ijson.JSONError)
+except ImportError:
+    __HAS_IJSON = False
+    __PARSE_ERRORS = (ValueError,)
+
+try:
+    import orjson
+    __HAS_ORJSON = True
+except ImportError:
+    __HAS_ORJSON = False
+
+
+# The same checkers are coloured for every project.
+@functools.lru_cache(maxsize=None)
 def hex_colour_for_string(text: str) -> str:
-    return "#" + str(int(hashlib.sha1(text.encode("utf-8")).hexdigest(),
-                         16) % (10 ** 6))
+    # Three bytes of digest are exactly the six hex digits of a colour.
+    return "#" + hashlib.blake2b(text.encode("utf-8"),
+                                 digest_size=3).hexdigest()
 
 
 def load_json(json_file: str, fail_on_error: bool) -> dict:
-    with open(json_file, 'r', encoding="utf-8", errors="ignore") as handle:
-        data = json.load(handle, strict=False)
-        if not data and fail_on_error:
-            logging.error("Configuration file loading failed, or is empty.")
-            sys.exit(1)
-        return data
+    if __HAS_ORJSON:
+        # orjson parses the bytes directly, without decoding them first.
+        with open(json_file, 'rb') as handle:
+            content = handle.read()
+        try:
+            data = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # orjson rejects control characters in strings and invalid
+            # UTF-8.
+            data = json.loads(content.decode("utf-8", errors="ignore"),
+                              strict=False)
+    else:
+        with open(json_file, 'r', encoding="utf-8", errors="ignore") \
+                as handle:
+            data = json.load(handle, strict=False)
+    if not data and fail_on_error:
+        logging.error("Configuration file loading failed, or is empty.")
+        sys.exit(1)
+    return data
+
+
+# Smaller profiles are parsed whole with orjson, which is faster than
+# streaming them.
+STREAMING_THRESHOLD = 64 * 1024
+
+
+def read_profile_items(json_file: str) -> List[Tuple[str, float]]:
+    """
+    Returns the entries of the profile in a Tidy profiling output. If ijson
+    is available, only the profile is parsed from large files instead of
+    the whole file. A file that cannot be parsed is skipped as a whole.
+    """
+    try:
+        if __HAS_IJSON:
+            with open(json_file, 'rb') as handle:
+                if not __HAS_ORJSON or os.fstat(handle.fileno()).st_size \
+                        >= STREAMING_THRESHOLD:
+                    return list(ijson.kvitems(handle, "profile",
+                                              use_float=True))
+        file_data = load_json(json_file, False)
+        return list(file_data.get("profile", {}).items()) if file_data \
+            else []
+    except __PARSE_ERRORS:
+        logging.warning("Could not parse '%s', skipping it.", json_file)
+        return []
 
 
 def process_project(config: dict, root_dir: str, project_name: str,
-                    HTML: stat_html.HTMLPrinter):
+                    HTML: stat_html.HTMLPrinter,
+                    executor: Optional[Executor] = None):
     logging.info("Processing project '%s'...", project_name)
     basedir = os.path.join(root_dir, project_name)
     if not os.path.isdir(basedir):
         logging.error("Directory for project '%s' not found", project_name)
         return
 
+    # The checker times and the number of profiles of each configuration.
     results = dict()
     for configuration in config["configurations"]:
         results[configuration["name"]] = \
             process_project_at_configuration(root_dir,
                                              project_name,
-                                             configuration["name"])
+                                             configuration["name"],
+                                             executor)
 
     make_chart(config, root_dir, project_name, results, HTML)
     logging.info("Done processing project '%s'.", project_name)
 
 
+# The number of profiles parsed by a worker process at once.
+PROFILE_BATCH_SIZE = 64
+
+
 def process_project_at_configuration(root_dir: str,
                                      project_name: str,
-                                     configuration: str) -> Optional[dict]:
+                                     configuration: str,
+                                     executor: Optional[Executor] = None) \
+        -> Tuple[Counter, int]:
+    # The project directory is checked by process_project, and a directory
+    # that cannot be listed is skipped by iter_profile_files.
     basedir = os.path.join(root_dir, project_name)
-    if not os.path.isdir(basedir):
-        logging.error("Directory for project '%s' not found", project_name)
-        return None
-
     logging.info("Collecting data for '%s' with '%s'",
                  project_name, configuration)
 
-    results = {"meta": {"files": 0}}
-
-    for root, dirs, _ in os.walk(basedir):
-        if configuration not in dirs:
-            continue
-
-        local_results = get_tidy_profiles_from_dir(
-            os.path.join(root, configuration))
-        if not local_results:
-            logging.debug("Configuration-like directory '%s' was empty.",
-                          os.path.join(root, configuration))
-            continue
-
-        merge_results(results, local_results)
+    if executor:
+        # The profiles are parsed independently, in batches to amortize
+        # the cost of passing the work to the processes.
+        json_files = list(iter_profile_files(basedir, configuration))
+        batches = [json_files[i:i + PROFILE_BATCH_SIZE]
+                   for i in range(0, len(json_files), PROFILE_BATCH_SIZE)]
+        results = Counter()
+        files = 0
+        for batch_results, batch_files in executor.map(get_tidy_profiles,
+                                                       batches):
+            results.update(batch_results)
+            files += batch_files
+    else:
+        results, files = get_tidy_profiles(
+            iter_profile_files(basedir, configuration))
 
-    if results["meta"]["files"] > 0:
+    if files > 0:
         logging.info("Done. Writing output...")
         emit_csv_for_results(os.path.join(root_dir,
                                           project_name + "_" +
@@ -119,70 +185,66 @@ def process_project_at_configuration(root_dir: str,
         logging.warning("Did not find results for configuration '%s' for '%s'",
                         configuration, project_name)
 
-    return results
+    return results, files
 
 
-def get_tidy_profiles_from_dir(directory: str) -> dict:
-    results = {"meta": {"files": 0}}
-
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if not file.endswith(".json"):
-                continue
-
-            file_data = load_json(os.path.join(root, file), False)
-            if not file_data:
-                continue
-
-            results["meta"]["files"] += 1
-
-            for key, value in file_data["profile"].items():
-                if not key.startswith("time.") or not key.endswith(".wall"):
-                    continue
-                checker_name = key.replace("time.clang-tidy.", ""). \
-                    replace(".wall", "")
-
-                try:
-                    results[checker_name] += value
-                except KeyError:
-                    results[checker_name] = value
-
-    return results
-
-
-def merge_results(results: dict, to_add: dict) -> dict:
-    try:
-        results["meta"]["files"] += to_add["meta"]["files"]
-    except KeyError:
+def iter_profile_files(basedir: str, configuration: str) -> Iterator[str]:
+    """
+    Yields the Tidy profiling outputs in the directories named after the
+    configuration, anywhere under basedir. The tree is walked only once,
+    and the type of the entries is known from the directory listing.
+    """
+    stack = [(basedir, False)]
+    while stack:
+        directory, in_configuration = stack.pop()
         try:
-            results["meta"]["files"] = to_add["meta"]["files"]
-        except KeyError:
-            results["meta"]["files"] = 0
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, in_configuration or
+                                      entry.name == configuration))
+                    elif in_configuration and entry.name.endswith(".json") \
+                            and entry.is_file():
+                        yield entry.path
+        except OSError:
+            logging.debug("Could not list '%s'.", directory)
+
+
+def get_tidy_profiles(json_files: Iterable[str]) -> Tuple[Counter, int]:
+    """
+    Returns the wall times of the checkers summed over the profiles, and
+    the number of files that had a profile.
+    """
+    # Missing checkers are counted from zero, without handling a KeyError.
+    results = Counter()
+    files = 0
+
+    for json_file in json_files:
+        has_profile = False
+        for key, value in read_profile_items(json_file):
+            has_profile = True
+            if not key.startswith("time.") or not key.endswith(".wall"):
+                continue
+            checker_name = key.removeprefix("time.clang-tidy."). \
+                removesuffix(".wall")
+            results[checker_name] += value
+        if has_profile:
+            files += 1
 
-    for key in to_add:
-        if key == "meta":
-            continue
+    return results, files
 
-        try:
-            results[key] += to_add[key]
-        except KeyError:
-            results[key] = to_add[key]
 
-    return results
+def sorted_checker_times(results: Counter) -> List[Tuple[str, float]]:
+    """Returns the checkers with their wall times, the slowest first."""
+    return results.most_common()
 
 
-def emit_csv_for_results(output_path: str, results: dict):
-    with open(output_path, 'w') as handle:
+def emit_csv_for_results(output_path: str, results: Counter):
+    # The csv module writes its own line endings.
+    with open(output_path, 'w', newline='', encoding="utf-8") as handle:
         writer = csv.writer(handle)
         writer.writerow(["Check", "Wall-Time"])
-
-        for key, value in sorted(
-                filter(lambda kv: kv[0] != "meta", results.items()),
-                key=lambda kv: kv[1],
-                reverse=True):
-            if key == "meta":
-                continue
-            writer.writerow([key, value])
+        writer.writerows(sorted_checker_times(results))
 
 
 def make_chart(config: dict, root_dir: str, project_name: str, results: dict,
@@ -198,23 +260,21 @@ def make_chart(config: dict, root_dir: str, project_name: str, results: dict,
             len(highlight_checkers)))
     except KeyError:
         highlight_checkers = highlight_colours = []
+    highlight_set = set(highlight_checkers)
 
     # Create a list of all checkers so the colouring is consistent.
-    all_checkers = set()
-    for _, data in results.items():
-        all_checkers.update(data.keys())
-    all_checkers.remove("meta")
-    all_checkers = sorted(all_checkers)
-
-    colors = dict(map(lambda cn: [cn, hex_colour_for_string(cn)]
-                          if cn not in highlight_checkers
-                          else [cn, "__HIGHLIGHT__"],
-                      all_checkers))
-    hi_idx = 0
-    for cn, c in colors.items():
-        if c == "__HIGHLIGHT__":
-            colors[cn] = highlight_colours[hi_idx]
-            hi_idx += 1
+    all_checkers = sorted(set().union(*(times for times, _
+                                        in results.values())))
+
+    # The highlighted checkers get the highlight colours in order.
+    highlight_colours = iter(highlight_colours)
+    colors = {cn: next(highlight_colours) if cn in highlight_set
+              else hex_colour_for_string(cn)
+              for cn in all_checkers}
+    # Every chart lists all the checkers in the same order, so the colours
+    # and the highlights are the same for each of them.
+    colors_ordered = [colors[cn] for cn in all_checkers]
+    pulls = [0.225 if cn in highlight_set else 0 for cn in all_checkers]
 
     # Set up the canvas.
     max_row = config["tidy_charts"]["rows"]
@@ -225,7 +285,7 @@ def make_chart(config: dict, root_dir: str, project_name: str, results: dict,
                                   if "tidy_chart_title" in cfg
                                   else cfg["name"],
                       filter(lambda cfg: cfg["name"] in results and
-                                results[cfg["name"]]["meta"]["files"] > 0,
+                                results[cfg["name"]][1] > 0,
                              config["configurations"])))
     fig = psp.make_subplots(rows=max_row,
                             cols=max_col,
@@ -234,7 +294,11 @@ def make_chart(config: dict, root_dir: str, project_name: str, results: dict,
 
     web_statistics = dict()
 
-    # Draw a plot for each configuration.
+    # Draw a plot for each configuration. The plots are added to the figure
+    # in one batch, as every addition validates all the earlier ones.
+    traces = []
+    rows = []
+    cols = []
     r = 1
     c = 0
     for configuration in config["configurations"]:
@@ -248,33 +312,24 @@ def make_chart(config: dict, root_dir: str, project_name: str, results: dict,
                 if "tidy_chart_title" in configuration else cfg
         if cfg not in results:
             continue
-
-        results_for_cfg = OrderedDict()
-        colors_ordered = list()
-        for k, v in sorted(filter(lambda kv: kv[0] != "meta",
-                                  results[cfg].items()),
-                           key=lambda kv: kv[1],
-                           reverse=True):
-            results_for_cfg[k] = v
-            colors_ordered.append(colors[k])
+        times, _ = results[cfg]
 
         # For the webpage, show only the meaningful results.
-        web_statistics[label] = copy.deepcopy(results_for_cfg)
-
-        for missing_checker_in_this_cfg in all_checkers - \
-                results_for_cfg.keys():
-            results_for_cfg[missing_checker_in_this_cfg] = 0
-            colors_ordered.append(colors[missing_checker_in_this_cfg])
-
-        fig.add_trace(pgo.Pie(
-            labels=list(results_for_cfg.keys()),
-            values=list(map(lambda kv: kv[1],
-                            results_for_cfg.items())),
-            pull=list(map(lambda cn: 0.225 if cn in highlight_checkers else 0,
-                          results_for_cfg.keys())),
+        web_statistics[label] = dict(sorted_checker_times(times))
+
+        # The slices are sorted by their value by plotly.
+        traces.append(pgo.Pie(
+            labels=all_checkers,
+            values=[times[cn] for cn in all_checkers],
+            pull=pulls,
             marker=dict(colors=colors_ordered),
-            name=label),
-                      r, c)
+            sort=True,
+            name=label))
+        rows.append(r)
+        cols.append(c)
+
+    if traces:
+        fig.add_traces(traces, rows=rows, cols=cols)
 
     fig.update_traces(hoverinfo="label+value+percent", textinfo="none")
     fig.update(layout_title_text=project_name)
@@ -314,6 +369,11 @@ def main():
                         default=1,
                         help="The number of columns to organise the results in "
                              "the created charts.")
+    parser.add_argument("-j", "--jobs",
+                        metavar="JOBS",
+                        type=int,
+                        default=os.cpu_count(),
+                        help="The number of processes parsing the profiles.")
     args = parser.parse_args()
 
     logging.info("Using configuration file '%s'.", args.config)
@@ -325,10 +385,12 @@ def main():
     config["tidy_charts"]["rows"] = args.rows
     config["tidy_charts"]["columns"] = args.cols
 
-    with stat_html.HTMLPrinter(os.path.join(args.dir, "tidy_results.html"),
-                               config) as HTML:
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor, \
+            stat_html.HTMLPrinter(os.path.join(args.dir, "tidy_results.html"),
+                                  config) as HTML:
         for project in config["projects"]:
-            process_project(config, args.dir, project["name"], HTML)
+            process_project(config, args.dir, project["name"], HTML,
+                            executor)
 
 
 if __name__ == '__main__':